@@ -157,11 +157,21 @@ class OLSModel(LikelihoodModel):
 # TODO: handle case for noconstant regression
         self.design = design
         self.wdesign = self.whiten(self.design)
-        self.calc_beta = np.linalg.pinv(self.wdesign)
+        # pseudoinverse from a single SVD, same cutoff as np.linalg.pinv
+        U, s, Vh = np.linalg.svd(self.wdesign, full_matrices=False)
+        nonzero = s > 1.e-15 * s.max()
+        sinv = np.zeros_like(s)
+        sinv[nonzero] = 1. / s[nonzero]
+        self.calc_beta = np.dot(Vh.T * sinv, U.T)
         self.normalized_cov_beta = np.dot(self.calc_beta,
                                          np.transpose(self.calc_beta))
         self.df_total = self.wdesign.shape[0]
-        self.df_model = utils.rank(self.design)
+        if self.wdesign is self.design:
+            # no whitening: reuse the singular values for the rank,
+            # as utils.rank would compute them
+            self.df_model = int(np.sum(s / s.max() > 1.0e-12))
+        else:
+            self.df_model = utils.rank(self.design)
         self.df_resid = self.df_total - self.df_model
 
     def logL(self, beta, Y, nuisance=None):
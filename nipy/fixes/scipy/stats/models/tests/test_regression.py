@@ -11,37 +11,34 @@ from nipy.fixes.scipy.stats.models.regression import OLSModel, ARModel
 
 W = standard_normal
 
+# design and response shared by all tests
+X = W((40,10))
+Y = W((40,))
+
 class TestRegression(TestCase):
 
+    def setUp(self):
+        # the degenerate tests modify the design, so work on a copy
+        self.X = X.copy()
+        self.Y = Y
+
+    def _degenerate(self):
+        self.X[:,0] = self.X[:,1] + self.X[:,2]
+
+    def _check_fit(self, model, expected_df):
+        results = model.fit(self.Y)
+        self.assertEqual(results.df_resid, expected_df)
+
     def testOLS(self):
-        X = W((40,10))
-        Y = W((40,))
-        model = OLSModel(design=X)
-        results = model.fit(Y)
-        self.assertEquals(results.df_resid, 30)
+        self._check_fit(OLSModel(design=self.X), 30)
 
     def testAR(self):
-        X = W((40,10))
-        Y = W((40,))
-        model = ARModel(design=X, rho=0.4)
-        results = model.fit(Y)
-        self.assertEquals(results.df_resid, 30)
+        self._check_fit(ARModel(design=self.X, rho=0.4), 30)
 
     def testOLSdegenerate(self):
-        X = W((40,10))
-        X[:,0] = X[:,1] + X[:,2]
-        Y = W((40,))
-        model = OLSModel(design=X)
-        results = model.fit(Y)
-        self.assertEquals(results.df_resid, 31)
+        self._degenerate()
+        self._check_fit(OLSModel(design=self.X), 31)
 
     def testARdegenerate(self):
-        X = W((40,10))
-        X[:,0] = X[:,1] + X[:,2]
-        Y = W((40,))
-        model = ARModel(design=X, rho=0.9)
-        results = model.fit(Y)
-        self.assertEquals(results.df_resid, 31)
-
-
-
+        self._degenerate()
+        self._check_fit(ARModel(design=self.X, rho=0.9), 31)
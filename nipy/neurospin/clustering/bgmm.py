@@ -23,7 +23,6 @@ from scipy.special import gammaln
 import math
 
 
-import nipy.neurospin.clustering.clustering as fc
 from gmm import GMM
 
 # --------------------------------------------
@@ -483,7 +482,7 @@ class BGMM(GMM):
         if nocheck==True:
             self.check()
 
-    def initialize(self, x):
+    def initialize(self, x, init_method='kmeans'):
         """
         initialize z using a k-means algorithm, then upate the parameters
 
@@ -491,11 +490,10 @@ class BGMM(GMM):
         ----------
         x: array of shape (nb_samples,self.dim)
            the data used in the estimation process
+        init_method: string, optional,
+                     the way z is initialized, see GMM.initialize
         """
-        if self.k>1:
-            cent,z,J = fc.kmeans(x,self.k)
-        else:
-            z = np.zeros(x.shape[0]).astype(np.int)
+        z = self._initial_labels(x, init_method)
         self.update(x,z)
     
     def pop(self, z):
@@ -1051,7 +1049,7 @@ class VBGMM(BGMM):
         #(not used, but for completness and interpretation)
         
         
-    def initialize(self, x):
+    def initialize(self, x, init_method='kmeans'):
         """
         initialize z using a k-means algorithm, then upate the parameters
 
@@ -1059,12 +1057,11 @@ class VBGMM(BGMM):
         ----------
         x: array of shape (nb_samples,self.dim)
            the data used in the estimation process
+        init_method: string, optional,
+                     the way z is initialized, see GMM.initialize
         """
         n = x.shape[0]
-        if self.k>1:
-            cent, z, J = fc.kmeans(x, self.k)
-        else:
-            z = np.zeros(x.shape[0]).astype(np.int)
+        z = self._initial_labels(x, init_method)
         l = np.zeros((n,self.k))
         l[np.arange(n),z]=1
         self._Mstep(x,l)
@@ -10,6 +10,7 @@ Author : Bertrand Thirion, 2006-2009
 """
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from scipy.linalg import eigvalsh 
 
 class GridDescriptor(object):
@@ -60,10 +61,7 @@ class GridDescriptor(object):
         grid: array of shape (nb_nodes, self.dim)
               where nb_nodes is the prod of self.n_bins
         """
-        size = np.prod(self.n_bins)
-        grid = np.zeros((size,self.dim))
         grange = []
-
         for j in range(self.dim):
             xm = self.lim[2*j]
             xM = self.lim[2*j+1]
@@ -71,32 +69,36 @@ class GridDescriptor(object):
                 xb = self.n_bins
             else:
                 xb = self.n_bins[j]
-            gr = xm +float(xM-xm)/(xb-1)*np.arange(xb).astype('f')
-            grange.append(gr)
-
-        if self.dim==1:
-            grid = np.array([[grange[0][i]] for i in range(xb)])
-
-        if self.dim==2:
-            for i in range(self.n_bins[0]):
-                for j in range(self.n_bins[1]):
-                    grid[i*self.n_bins[1]+j,:]= np.array([grange[0][i],
-                                                       grange[1][j]])
-
-        if self.dim==3:
-            for i in range(self.n_bins[0]):
-                for j in range(self.n_bins[1]):
-                    for k in range(self.n_bins[2]):
-                        q = (i*self.n_bins[1]+j)*self.n_bins[2]+k
-                        grid[q,:]= np.array([grange[0][i],
-                                             grange[1][j],grange[2][k]])
-        if self.dim>3:
-            raise NotImplementedError, \
-                   'only dimensions <4 are currently handled'
+            grange.append(np.linspace(xm, xM, xb))
+
+        # the last coordinate varies fastest
+        mesh = np.meshgrid(*grange, indexing='ij')
+        grid = np.array([m.ravel() for m in mesh]).T
         return grid
 
+def _fit_GMM(args):
+    """
+    Fit a GMM with k components to x; returns the model and its bic
+
+    This is a module-level function so that it can be dispatched
+    to worker processes by best_fitting_GMM
+
+    Parameters
+    ----------
+    args: tuple (x, k, prec_type, niter, delta, ninit, verbose, seed)
+          see best_fitting_GMM; if seed is not None,
+          the random number generator is reseeded with it
+    """
+    x, k, prec_type, niter, delta, ninit, verbose, seed = args
+    if seed is not None:
+        np.random.seed(seed)
+    lgmm = GMM(k, x.shape[1], prec_type)
+    gmmk = lgmm.initialize_and_estimate(x, None, niter, delta, ninit,
+                                        verbose)
+    return gmmk.evidence(x), gmmk
+
 def best_fitting_GMM(x, krange, prec_type='full', niter=100, delta = 1.e-4,
-                     ninit=1,verbose=0):
+                     ninit=1, verbose=0, n_jobs=1):
     """
     Given a certain dataset x, find the best-fitting GMM
     within a certain range indexed by krange
@@ -107,15 +109,22 @@ def best_fitting_GMM(x, krange, prec_type='full', niter=100, delta = 1.e-4,
        the data from which the model is estimated
     krange: list of floats,
             the range of values to test for k
-    prec_type: string (to be chosen within 'full','diag'), optional,
-              the covariance parameterization
+    prec_type: string (to be chosen within 'full','diag','spherical'),
+              optional, the covariance parameterization
     niter: int, optional,
            maximal number of iterations in the estimation process
     delta: float, optional,
-           increment of data likelihood at which convergence is declared
+           relative change of the average data log-likelihood
+           at which convergence is declared
     ninit: int
            number of initialization performed
     verbose=0: verbosity mode
+    n_jobs: int, optional,
+            number of processes among which the values of k are
+            distributed; if None, all the cpus are used.
+            When several processes are used, each fit is run
+            with its own random seed, drawn from the current
+            state of the numpy random number generator
     
     Returns
     -------
@@ -124,13 +133,26 @@ def best_fitting_GMM(x, krange, prec_type='full', niter=100, delta = 1.e-4,
     if np.size(x) == x.shape[0]:
         x = np.reshape(x,(np.size(x), 1))
 
-    dim = x.shape[1]
+    if n_jobs==1:
+        seeds = [None]*len(krange)
+    else:
+        # forked workers share the parent state of the generator:
+        # give each fit its own seed
+        seeds = np.random.randint(np.iinfo(np.int32).max, size=len(krange))
+    args = [(x, k, prec_type, niter, delta, ninit, verbose, seed)
+            for k, seed in zip(krange, seeds)]
+    if n_jobs==1:
+        fits = map(_fit_GMM, args)
+    else:
+        from multiprocessing import Pool
+        pool = Pool(n_jobs)
+        try:
+            fits = pool.map(_fit_GMM, args)
+        finally:
+            pool.terminate()
+
     bestbic = -np.infty
-    for k in krange:
-        lgmm = GMM(k, dim, prec_type)
-        gmmk = lgmm.initialize_and_estimate(x, None, niter, delta, ninit,
-                                            verbose)
-        bic = gmmk.evidence(x)
+    for k, (bic, gmmk) in zip(krange, fits):
         if bic>bestbic:
             bestbic = bic
             bgmm = gmmk
@@ -205,27 +227,69 @@ def plot2D(x, my_gmm, z=None, with_dots=True, log_scale=False, mpaxes=None,
     Pdens= np.reshape(L,(gdx,np.size(L)/gdx))
     extent = [xm, xs, ym, ys]
     if log_scale:
-        mp.imshow(np.log(Pdens.T), alpha=2.0, origin ='lower',
-                  extent=extent)
+        im = mp.imshow(np.log(Pdens.T), alpha=2.0, origin ='lower',
+                       extent=extent)
     else:
-        mp.imshow(Pdens.T, alpha=2.0, origin ='lower', extent=extent)
+        im = mp.imshow(Pdens.T, alpha=2.0, origin ='lower', extent=extent)
 
     if with_dots:
         if z==None:
             mp.plot(x[:,0],x[:,1],'o')
         else:
+            # a single artist, colored by label
             import matplotlib as ml
-            hsv = ml.cm.hsv(range(256)) 
-            col = hsv[range(0,256,256/int(z.max()+1)),:]
-            for k in range(z.max()+1):
-                mp.plot(x[z==k,0],x[z==k,1],'o',color=col[k])   
+            mp.scatter(x[:,0], x[:,1], c=z, cmap=ml.cm.hsv, s=36,
+                       vmin=0, vmax=z.max()+1)
            
     mp.axis(extent)
-    mp.colorbar()
+    mp.colorbar(im)
     
     return gd1, ax
 
 
+def _repeat_view(a, k):
+    """
+    Returns a read-only view of a, an array of shape (1, ...),
+    repeated k times along its first axis without copying the data
+    """
+    view = as_strided(a, (k,) + a.shape[1:], (0,) + a.strides[1:])
+    view.flags.writeable = False
+    return view
+
+
+def _kmeanspp(x, k):
+    """
+    k-means++ seeding (Arthur and Vassilvitskii, SODA 2007):
+    the first center is drawn uniformly among the rows of x,
+    each following one with a probability proportional to its
+    squared distance to the nearest center already chosen
+
+    Parameters
+    ----------
+    x: array of shape (n_samples,dim)
+       the data to be clustered
+    k: int, the number of centers
+
+    Returns
+    -------
+    z: array of shape (n_samples)
+       the index of the center nearest to each row of x
+    """
+    n = x.shape[0]
+    centers = np.zeros((k, x.shape[1]))
+    centers[0] = x[np.random.randint(n)]
+    d2 = np.sum((x-centers[0])**2, 1)
+    for i in range(1, k):
+        cd2 = np.cumsum(d2)
+        j = min(np.searchsorted(cd2, np.random.rand()*cd2[-1]), n-1)
+        centers[i] = x[j]
+        np.minimum(d2, np.sum((x-centers[i])**2, 1), out=d2)
+
+    # label the data by the nearest center
+    dist = np.sum(centers**2, 1) - 2*np.dot(x, centers.T)
+    return np.argmin(dist, 1)
+
+
 class GMM():
     """
     Standard GMM.
@@ -235,19 +299,22 @@ class GMM():
     dim (int): is the dimension of the data
     prec_type = 'full' (string) is the parameterization
               of the precisions/covariance matrices:
-              either 'full' or 'diagonal'.
+              either 'full', 'diag' or 'spherical' (isotropic).
     means: array of shape (k,dim):
           all the means (mean parameters) of the components
-    precisions: array of shape (k,dim,dim):
+    precisions: array of shape (k,dim,dim), (k,dim) or (k):
                the precisions (inverse covariance matrix) of the components    
     weights: array of shape(k): weights of the mixture
+    dtype: numpy dtype used for the component-wise likelihoods
+           computed in the E step (np.float64 by default)
 
     fixme :
     - no copy method
     """
+    dtype = np.float64
 
     def __init__(self, k=1, dim=1, prec_type='full', means = None,
-                 precisions=None, weights=None):
+                 precisions=None, weights=None, dtype=np.float64):
         """
         Initialize the structure, at least with the dimensions of the problem
 
@@ -256,11 +323,15 @@ class GMM():
         k (int) the number of classes of the model
         dim (int) the dimension of the problem
         prec_type = 'full' : coavriance:precision parameterization
-                  (diagonal 'diag' or full 'full').
+                  (diagonal 'diag', full 'full' or isotropic 'spherical').
         means = None: array of shape (self.k,self.dim)
         precisions = None:  array of shape (self.k,self.dim,self.dim)
-                   or (self.k, self.dim)
+                   or (self.k, self.dim) or (self.k)
         weights=None: array of shape (self.k)
+        dtype=np.float64: precision of the component-wise likelihoods;
+                          np.float32 halves the memory traffic of the
+                          E step, the log-likelihood sums and the M step
+                          being still computed in double precision
 
         By default, means, precision and weights are set as
         zeros()
@@ -274,6 +345,7 @@ class GMM():
         self.means = means
         self.precisions = precisions
         self.weights = weights
+        self.dtype = dtype
 
         if self.means==None:
             self.means = np.zeros((self.k,self.dim))
@@ -282,6 +354,8 @@ class GMM():
             if prec_type=='full':
                 prec = np.reshape(np.eye(self.dim),(1,self.dim,self.dim))
                 self.precisions = np.repeat(prec,self.k,0)
+            elif prec_type=='spherical':
+                self.precisions = np.ones(self.k)
             else:
                 self.precisions = np.ones((self.k,self.dim))
             
@@ -296,48 +370,78 @@ class GMM():
         ----------
         means: array of shape (self.k,self.dim)
         precisions:  array of shape (self.k,self.dim,self.dim)
-                     or (self.k, self.dim)
+                     or (self.k, self.dim) or (self.k)
         weights: array of shape (self.k)
         """
         self.means = means
         self.precisions = precisions
         self.weights = weights
         self.check()
+
+    def _precision_factors(self):
+        """
+        Returns the Cholesky factors and log-determinants of the precisions
+
+        Returns
+        -------
+        chol: array of shape (self.k, self.dim, self.dim)
+              factors such that precisions[k] = chol[k]*chol[k].T
+              (None unless prec_type=='full')
+        logdet: array of shape (self.k)
+                the log-determinants of the precisions
+
+        Note
+        ----
+        these are recomputed at each call, as the precisions
+        may be modified in place (e.g. by BGMM).
+        Singular precision matrices are factored
+        through their eigen-decomposition instead;
+        their log-determinant is then -inf,
+        so that the corresponding likelihood is zero
+        """
+        if self.prec_type=='full':
+            try:
+                chol = np.linalg.cholesky(self.precisions)
+                logdet = 2*np.sum(np.log(np.diagonal(chol, axis1=1,
+                                                     axis2=2)), 1)
+            except np.linalg.LinAlgError:
+                eig, vec = np.linalg.eigh(self.precisions)
+                eig = np.maximum(eig, 0)
+                chol = vec*np.sqrt(eig)[:, np.newaxis]
+                olderr = np.seterr(divide='ignore')
+                logdet = np.sum(np.log(eig), 1)
+                np.seterr(**olderr)
+        elif self.prec_type=='spherical':
+            chol = None
+            logdet = self.dim*np.log(self.precisions)
+        else:
+            chol = None
+            logdet = np.sum(np.log(self.precisions), 1)
+        return chol, logdet
     
     def check(self):
         """
         Checking the shape of different matrices involved in the model
         """
-        if self.means.shape[0] != self.k:
-            raise ValueError," self.means does not have correct dimensions"
-            
-        if self.means.shape[1] != self.dim:
+        if self.prec_type=='full':
+            prec_shape = (self.k, self.dim, self.dim)
+        elif self.prec_type=='diag':
+            prec_shape = (self.k, self.dim)
+        elif self.prec_type=='spherical':
+            prec_shape = (self.k,)
+        else:
+            raise ValueError, 'unknown precisions type'
+
+        if np.shape(self.means) != (self.k, self.dim):
             raise ValueError," self.means does not have correct dimensions"
 
-        if self.weights.size != self.k:
+        if np.size(self.weights) != self.k:
             raise ValueError," self.weights does not have correct dimensions"
         
-        if self.dim !=  self.precisions.shape[1]:
+        if np.shape(self.precisions) != prec_shape:
             raise ValueError, "\
             self.precisions does not have correct dimensions"
 
-        if self.prec_type=='full':
-            if self.dim !=  self.precisions.shape[2]:
-                raise ValueError, "\
-                self.precisions does not have correct dimensions"
-
-        if self.prec_type=='diag':
-            if np.shape(self.precisions) !=  np.shape(self.means):
-                raise ValueError, "\
-                self.precisions does not have correct dimensions"
-
-        if self.precisions.shape[0] != self.k:
-            raise ValueError,"\
-            self.precisions does not have correct dimensions"
-
-        if self.prec_type not in ['full','diag']:
-            raise ValueError, 'unknown precisions type'
-
     def check_x(self,x):
         """
         essentially check that x.shape[1]==self.dim
@@ -350,7 +454,7 @@ class GMM():
             raise ValueError, 'incorrect size for x'
         return x
 
-    def initialize(self, x):
+    def initialize(self, x, init_method='kmeans'):
         """
         this function initializes self according to a certain dataset x:
         1. sets the regularizing hyper-parameters
@@ -361,24 +465,53 @@ class GMM():
         ----------
         x, array of shape (n_samples,self.dim)
            the data used in the estimation process
+        init_method: string, optional,
+                     the way z is initialized: 'kmeans' (full
+                     k-means clustering), 'kmeans++' (k-means++
+                     seeding then nearest center, much cheaper)
+                     or 'random' (random labels)
         """
-        import nipy.neurospin.clustering.clustering as fc
         n = x.shape[0]
         
         #1. set the priors
         self.guess_regularizing(x, bcheck=1)
 
         # 2. initialize the memberships
-        if self.k>1:
-            cent,z,J = fc.kmeans(x, self.k)
-        else:
-            z = np.zeros(n).astype(np.int)
-        
+        z = self._initial_labels(x, init_method)
         l = np.zeros((n, self.k))
         l[np.arange(n),z]=1
 
         # 3.update the parameters
         self.update(x,l)
+
+    def _initial_labels(self, x, init_method='kmeans'):
+        """
+        returns an initial labelling of x into self.k classes
+
+        Parameters
+        ----------
+        x, array of shape (n_samples,self.dim)
+           the data used in the estimation process
+        init_method: string, optional,
+                     'kmeans', 'kmeans++' or 'random', see initialize
+
+        Returns
+        -------
+        z: array of shape (n_samples), the labels
+        """
+        n = x.shape[0]
+        if self.k==1:
+            return np.zeros(n).astype(np.int)
+        if init_method=='kmeans':
+            import nipy.neurospin.clustering.clustering as fc
+            cent,z,J = fc.kmeans(x, self.k)
+        elif init_method=='kmeans++':
+            z = _kmeanspp(x, self.k)
+        elif init_method=='random':
+            z = np.random.randint(self.k, size=n)
+        else:
+            raise ValueError, 'unknown initialization method'
+        return z
     
     def pop(self,l,tiny = 1.e-15):
         """
@@ -389,9 +522,9 @@ class GMM():
         l array of shape (n_samples,self.k):
           the likelihood of each item being in each class
         """
-        sl = np.maximum(tiny,np.sum(l,1))
-        nl = (l.T/sl).T
-        return np.sum(nl,0)
+        sl = np.sum(l,1)
+        np.maximum(sl, tiny, out=sl)
+        return np.dot(1.0/sl,l)
         
     def update(self,x,l):
         """
@@ -446,6 +579,9 @@ class GMM():
                 w += np.log(eigvalsh(b)).sum()
                 dx = m-x
                 q = np.sum(np.dot(dx,b)*dx,1)
+            elif self.prec_type=='spherical':
+                w += self.dim*np.log(b)
+                q = b*np.sum((m-x)**2,1)
             else:
                 w += np.sum(np.log(b))
                 q = np.dot((m-x)**2, b)
@@ -468,34 +604,71 @@ class GMM():
         -------
         like, array of shape(n_samples,self.k)
           unweighted component-wise likelihood
+        """
+        w = self._unweighted_log_likelihood(x)
+        return np.exp(w, w)
+
+    def _unweighted_log_likelihood(self, x):
+        """
+        return the log-likelihood of each data for each component
+        the values are not weighted by the component weights
+
+        Parameters
+        ----------
+        x: array of shape (n_samples,self.dim)
+           the data used in the estimation process
+
+        Returns
+        -------
+        log_like, array of shape(n_samples,self.k)
+          unweighted component-wise log-likelihood
 
         Note
         ----
-        Hopefully faster
+        all the components are handled at once: for full precisions,
+        the whitened deviations to the means are computed in a single
+        (n_samples, self.k, self.dim) buffer; otherwise the quadratic
+        forms are expanded into matrix products of shape (n_samples, self.k)
         """
-        xt = x.T.copy()
         n = x.shape[0]
-        like = np.zeros((n, self.k))
-
-        for k in range(self.k):
-            # compute the data-independent factor first
-            w = - np.log(2*np.pi)*self.dim
-            m = np.reshape(self.means[k], (self.dim, 1))
-            b = self.precisions[k]
-            if self.prec_type=='full':
-                w += np.log(eigvalsh(b)).sum()
-                dx = xt-m
-                sqx = dx*np.dot(b,dx)
-                q = np.zeros(n)
-                for d in range(self.dim):
-                    q += sqx[d]
+        # centre the data in double precision before casting to self.dtype,
+        # so that the differences to the means keep their accuracy
+        center = np.mean(self.means, 0)
+        x = np.asarray(x - center, self.dtype)
+        means = np.asarray(self.means - center, self.dtype)
+        chol, logdet = self._precision_factors()
+        # log-likelihood = -0.5*q + cst, q being the quadratic form
+        cst = 0.5*(logdet - np.log(2*np.pi)*self.dim)
+        if self.prec_type=='full' and self.dim>1:
+            # with precision = chol*chol.T, q = ||chol.T*(x-m)||^2,
+            # and x*chol is computed for all components in one product
+            chol = np.asarray(chol, self.dtype)
+            y = np.dot(x, np.hstack(chol)).reshape(n, self.k, self.dim)
+            y -= np.einsum('kd,kde->ke', means, chol)
+            w = np.einsum('nkd,nkd->nk', y, y)
+            w *= -0.5
+        else:
+            # diagonal, isotropic or 1D precisions p:
+            # q = x**2*p - 2*x*(p*m) + m**2*p, so that the log-likelihood
+            # is a single product of [x**2, x, 1] with the coefficients
+            prec = np.asarray(self.precisions, self.dtype)
+            if self.prec_type=='spherical':
+                prec = np.repeat(np.reshape(prec, (self.k, 1)), self.dim, 1)
             else:
-                w += np.sum(np.log(b))
-                q = np.dot(b, (m-xt)**2) # check !!!
-            w -= q
-            w /= 2
-            like[:,k] = np.exp(w)   
-        return like
+                prec = np.reshape(prec, (self.k, self.dim))
+            pm = prec*means
+            cst -= 0.5*np.sum(pm*means, 1)
+            coef = np.empty((2*self.dim+1, self.k), self.dtype)
+            coef[:self.dim] = -0.5*prec.T
+            coef[self.dim:-1] = pm.T
+            coef[-1] = cst
+            xx = np.empty((n, 2*self.dim+1), self.dtype)
+            np.multiply(x, x, xx[:, :self.dim])
+            xx[:, self.dim:-1] = x
+            xx[:, -1] = 1
+            return np.dot(xx, coef)
+        w += cst
+        return w
 
     
     def mixture_likelihood(self, x):
@@ -526,7 +699,7 @@ class GMM():
         x = self.check_x(x)
         like = self.likelihood(x)
         sl = np.sum(like,1)
-        sl = np.maximum(sl,tiny)
+        sl += tiny
         return np.mean(np.log(sl))
 
     def evidence(self, x):
@@ -547,28 +720,41 @@ class GMM():
         like = self.likelihood(x)
         return self.bic(like,tiny)
     
-    def bic(self, like, tiny = 1.e-15):
+    def bic(self, like=None, tiny=1.e-15, log_like_sum=None, n=None):
         """
         computation of bic approximation of evidence
                 
         Parameters
         ----------        
-        like, array of shape (n_samples,self.k)
+        like=None, array of shape (n_samples,self.k)
            component-wise likelihood
         tiny=1.e-15, a small constant to avoid numerical singularities
+        log_like_sum=None, float, optional
+           the total log-likelihood of the data, if already computed;
+           like is then not used
+        n=None, int, optional
+           the number of data points, required with log_like_sum
         
         Returns
         -------
         the bic value
         """
-        sl = np.sum(like,1)
-        sl = np.maximum(sl,tiny)
-        bicc  = np.sum(np.log(sl))
+        if log_like_sum is None:
+            if like is None:
+                raise ValueError, 'like or log_like_sum is required'
+            sl = np.sum(like,1)
+            sl += tiny
+            log_like_sum = np.sum(np.log(sl))
+            n = like.shape[0]
+        elif n is None:
+            raise ValueError, 'n is required with log_like_sum'
+        bicc = log_like_sum
         
         # number of parameters
-        n = like.shape[0]
         if self.prec_type=='full':
             eta = self.k*(1 + self.dim + (self.dim*self.dim+1)/2)-1
+        elif self.prec_type=='spherical':
+            eta = self.k*(1 + self.dim + 1)-1
         else:
             eta = self.k*(1 + 2*self.dim )-1
         bicc = bicc-np.log(n)*eta
@@ -591,6 +777,33 @@ class GMM():
         """
         return self.likelihood(x)
 
+    def _responsibilities(self, x):
+        """
+        E step of the EM algo, with the normalization of the likelihood
+        and the computation of the data log-likelihood done in the same
+        pass, in the log domain to avoid underflows
+
+        Parameters
+        ----------
+        x array of shape (n_samples,dim)
+          the data used in the estimation process
+
+        Returns
+        -------
+        resp: array of shape(n_samples,self.k)
+              the posterior probability of each component for each item
+        log_like: array of shape(n_samples)
+                  the log-likelihood of the mixture for each item
+        """
+        resp = self._unweighted_log_likelihood(x)
+        resp += np.log(self.weights)
+        wmax = resp.max(1)
+        resp -= wmax[:, np.newaxis]
+        np.exp(resp, resp)
+        sw = resp.sum(1, dtype=np.float64)
+        resp /= sw[:, np.newaxis]
+        return resp, wmax + np.log(sw)
+
     def guess_regularizing(self, x, bcheck=1):
         """
         Set the regularizing priors as weakly informative
@@ -610,12 +823,16 @@ class GMM():
         vx = np.dot(dx.T,dx)/x.shape[0]
         if self.prec_type=='full':
             px = np.reshape(np.diag(1.0/np.diag(vx)),(1,self.dim,self.dim))
+        elif self.prec_type=='spherical':
+            px = np.reshape(self.dim/np.trace(vx), (1,))
         else:
             px =  np.reshape(1.0/np.diag(vx),(1,self.dim))
         px *= np.exp(2.0/self.dim*np.log(self.k))
-        self.prior_means = np.repeat(mx,self.k,0)
+        # the priors are the same for all the components:
+        # use read-only broadcast views rather than copies
+        self.prior_means = _repeat_view(mx, self.k)
         self.prior_weights = np.ones(self.k)/self.k
-        self.prior_scale = np.repeat(px,self.k,0)
+        self.prior_scale = _repeat_view(px, self.k)
         self.prior_dof = self.dim+2
         self.prior_shrinkage = small
         self.weights = np.ones(self.k)*1.0/self.k
@@ -634,11 +851,11 @@ class GMM():
         like: array of shape(n_samples,self.k)
            the likelihood of the data under each class
         """
-        from numpy.linalg import pinv
         tiny  =1.e-15
-        pop = self.pop(like)
-        sl = np.maximum(tiny,np.sum(like,1))
+        sl = np.sum(like,1)
+        np.maximum(sl, tiny, out=sl)
         like = (like.T/sl).T
+        pop = np.sum(like,0)
         
         # shrinkage,weights,dof
         self.weights = self.prior_weights + pop
@@ -650,24 +867,29 @@ class GMM():
         shrinkage = pop + prior_shrinkage
 
         # means
-        means = np.dot(like.T,x)+ self.prior_means*prior_shrinkage
+        sx = np.dot(like.T,x)
+        means = sx + self.prior_means*prior_shrinkage
         self.means= means/shrinkage
         
         #precisions
-        empmeans = np.dot(like.T,x)/np.maximum(pop,tiny)
-        empcov = np.zeros(np.shape(self.precisions))
+        empmeans = sx/np.maximum(pop,tiny)
+        # deviations to all the empirical means: shape (k, n, dim),
+        # the only buffer of that size, transformed in place below
+        dx = x[np.newaxis] - empmeans[:, np.newaxis]
+        # deviations of the empirical means to the prior: shape (k, dim)
+        dxm = empmeans-self.prior_means
         
         if self.prec_type=='full':
-            for k in range(self.k):
-                dx = x-empmeans[k]
-                empcov[k] = np.dot(dx.T,like[:,k:k+1]*dx) 
-                    
-            covariance = np.array([pinv(self.prior_scale[k])
-                                   for k in range(self.k)])
-            covariance += empcov
+            # weighted scatter matrices: one BLAS product per component
+            dx *= np.sqrt(like.T)[:, :, np.newaxis]
+            empcov = np.array([np.dot(d.T, d) for d in dx])
+            if self.prior_scale.strides[0]==0:
+                # shared prior scale: invert it only once
+                covariance = empcov + np.linalg.inv(self.prior_scale[0])
+            else:
+                covariance = empcov + np.linalg.inv(self.prior_scale)
 
-            dx = np.reshape(empmeans-self.prior_means,(self.k,self.dim,1))
-            addcov = np.array([np.dot(dx[k],dx[k].T) for k in range(self.k)])
+            addcov = dxm[:, :, np.newaxis]*dxm[:, np.newaxis]
         
             apms =  np.reshape(prior_shrinkage*pop/shrinkage,(self.k,1,1))
             covariance += addcov*apms
@@ -675,19 +897,30 @@ class GMM():
             dof = self.prior_dof+pop+self.dim+2
             covariance /= np.reshape(dof,(self.k,1,1))
         
-            self.precisions = np.array([pinv(covariance[k]) \
-                                       for k in range(self.k)])
+            self.precisions = np.linalg.inv(covariance)
+        elif self.prec_type=='spherical':
+            # the variances are averaged across dimensions
+            dx **= 2
+            empcov = np.einsum('knd,nk->k', dx, like)/self.dim
+            covariance = 1.0/self.prior_scale
+            covariance += empcov
+
+            addcov = np.sum(dxm**2, 1)/self.dim
+
+            apms = np.reshape(prior_shrinkage*pop/shrinkage, self.k)
+            covariance += addcov*apms
+
+            dof = self.prior_dof+pop+self.dim+2
+            covariance /= np.reshape(dof, self.k)
+        
+            self.precisions = 1.0/covariance
         else:
-            for k in range(self.k):
-                dx = x-empmeans[k]
-                empcov[k] = np.sum(dx**2*like[:,k:k+1],0) 
-                    
-            covariance = np.array([1.0/(self.prior_scale[k])
-                                   for k in range(self.k)])
+            dx **= 2
+            empcov = np.einsum('knd,nk->kd', dx, like)
+            covariance = 1.0/self.prior_scale
             covariance += empcov
 
-            dx = np.reshape(empmeans-self.prior_means,(self.k,self.dim,1))
-            addcov = np.array([np.sum(dx[k]**2,0) for k in range(self.k)])
+            addcov = np.sum(dxm**2, 1)[:, np.newaxis]
 
             apms =  np.reshape(prior_shrinkage*pop/shrinkage,(self.k,1))
             covariance += addcov*apms
@@ -695,8 +928,7 @@ class GMM():
             dof = self.prior_dof+pop+self.dim+2
             covariance /= np.reshape(dof,(self.k,1))
         
-            self.precisions = np.array([1.0/covariance[k] \
-                                       for k in range(self.k)])
+            self.precisions = 1.0/covariance
 
     def map_label(self, x, like=None):
         """
@@ -729,24 +961,31 @@ class GMM():
         x array of shape (n_samples,dim)
           the data from which the model is estimated
         niter=100: maximal number of iterations in the estimation process
-        delta = 1.e-4: increment of data likelihood at which
-              convergence is declared
+        delta = 1.e-4: relative change of the average data
+              log-likelihood at which convergence is declared
+              (absolute change if that value is below 1 in magnitude)
         verbose=0: verbosity mode
 
         Returns
         -------
         bic : an asymptotic approximation of model evidence
+
+        Note
+        ----
+        the number of EM iterations performed is stored in self.niter_done
         """
         # check that the data is OK
         x = self.check_x(x)
         
         # alternation of E/M step until convergence
-        tiny = 1.e-15
         allOld = -np.infty
+        self.niter_done = 0
         for i in range(niter):
-            l = self._Estep(x)
-            all = np.mean(np.log(np.maximum( np.sum(l,1),tiny)))
-            if all<allOld+delta:
+            resp, log_like = self._responsibilities(x)
+            all = np.mean(log_like)
+            # relative tolerance, absolute when the average
+            # log-likelihood is close to 0
+            if i>0 and abs(all-allOld)<delta*max(abs(allOld), 1.):
                 if verbose:
                     print 'iteration:',i, 'log-likelihood:',all,\
                           'old value:',allOld
@@ -754,13 +993,15 @@ class GMM():
             else:
                 allOld = all
             if verbose:
-                print i, all, self.bic(l)
-            self._Mstep(x,l)
+                print i, all, self.bic(log_like_sum=np.sum(log_like),
+                                       n=x.shape[0])
+            self._Mstep(x,resp)
+            self.niter_done = i+1
             
-        return self.bic(l)
+        return self.bic(log_like_sum=np.sum(log_like), n=x.shape[0])
 
     def initialize_and_estimate(self, x, z=None, niter=100, delta = 1.e-4,\
-                                ninit=1, verbose=0):
+                                ninit=1, verbose=0, init_method='kmeans'):
         """
         estimation of self given x
 
@@ -771,23 +1012,26 @@ class GMM():
         z = None: array of shape (n_samples)
             a prior labelling of the data to initialize the computation
         niter=100: maximal number of iterations in the estimation process
-        delta = 1.e-4: increment of data likelihood at which
-              convergence is declared
+        delta = 1.e-4: relative change of the average data
+              log-likelihood at which convergence is declared
         ninit=1: number of initialization performed
                  to reach a good solution
         verbose=0: verbosity mode
+        init_method='kmeans': initialization method, see initialize
 
         Returns
         -------
         the best model is returned
         """
+        # check the data once for all the initializations
+        x = self.check_x(x)
         bestbic = -np.infty
-        bestgmm = GMM(self.k,self.dim,self.prec_type)
-        bestgmm.initialize(x)
+        bestgmm = GMM(self.k,self.dim,self.prec_type,dtype=self.dtype)
+        bestgmm.initialize(x, init_method)
         
         for i in range(ninit):
             # initialization -> Kmeans
-            self.initialize(x)
+            self.initialize(x, init_method)
 
             # alternation of E/M step until convergence
             bic = self.estimate(x, niter=niter, delta=delta, verbose=0)
@@ -797,11 +1041,13 @@ class GMM():
         
         return bestgmm
 
-    def train(self, x, z=None, niter=100, delta=1.e-4, ninit=1, verbose=0):
+    def train(self, x, z=None, niter=100, delta=1.e-4, ninit=1, verbose=0,
+              init_method='kmeans'):
         """
         idem initialize_and_estimate
         """
-        return self.initialize_and_estimate(x, z, niter, delta, ninit, verbose)
+        return self.initialize_and_estimate(x, z, niter, delta, ninit, verbose,
+                                            init_method)
 
     def test(self, x, tiny = 1.e-15):
         """
@@ -817,7 +1063,7 @@ class GMM():
         ll: array of shape(n_samples)
             the log-likelihood of the rows of x
         """
-        return np.log(np.maximum(self.mixture_likelihood(x),tiny)) 
+        return np.log(self.mixture_likelihood(x)+tiny) 
 
     
     def show_components(self, x, gd, density=None, mpaxes=None):
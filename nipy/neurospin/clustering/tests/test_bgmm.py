@@ -160,6 +160,20 @@ def test_vbgmm(verbose=0):
     assert(z.max()+1==b.k)
 
 
+def test_init_method():
+    """
+    check that the Bayesian models accept the GMM initialization methods
+    """
+    x = nr.randn(100, 2)
+    x[:30] += 2
+    for model in [BGMM, VBGMM]:
+        b = model(2, 2)
+        b.guess_priors(x)
+        for init_method in ['kmeans', 'kmeans++', 'random']:
+            b.initialize(x, init_method)
+            assert np.all(np.isfinite(b.means))
+
+
 def test_vbgmm_select(kmax = 6,verbose=0):
     """
     perform the estimation of a gmm
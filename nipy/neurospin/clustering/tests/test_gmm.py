@@ -5,6 +5,7 @@
 
 import numpy as np
 import numpy.random as nr
+from nipy.testing import assert_raises
 from nipy.neurospin.clustering.gmm import GMM
 import nipy.neurospin.clustering.gmm as gmm
 
@@ -126,6 +127,40 @@ def test_em_loglike6():
     print ll2, ll1,dkl
     assert ll2<ll1
 
+def test_em_loglike_float32():
+    """
+    check that the estimation in single precision is still accurate
+    """
+    dim = 2
+    k = 1
+    n = 1000
+    scale = 3.
+    offset = 4.
+    x = offset + scale * nr.randn(n,dim)
+    lgmm = GMM(k,dim,dtype=np.float32)
+    lgmm.initialize(x)
+    lgmm.estimate(x)
+    ll = lgmm.average_log_like(x)
+    ent = dim*0.5*(1+np.log(2*np.pi*scale**2))
+    assert lgmm.likelihood(x).dtype == np.float32
+    assert np.absolute(ll+ent)<dim*3./np.sqrt(n)
+
+def test_loglike_float32_offset():
+    """
+    check that single precision log-likelihoods remain accurate
+    for data far from the origin, as raw image intensities are
+    """
+    x = 1.e4 + nr.randn(500, 3)
+    x[:250] += 5
+    for prec_type in ['full', 'diag', 'spherical']:
+        lgmm = GMM(2, 3, prec_type, dtype=np.float32)
+        lgmm.initialize(x)
+        lgmm64 = GMM(2, 3, prec_type)
+        lgmm64.plugin(lgmm.means, lgmm.precisions, lgmm.weights)
+        ll = lgmm._unweighted_log_likelihood(x)
+        ll64 = lgmm64._unweighted_log_likelihood(x)
+        assert np.absolute(ll-ll64).max() < 1.e-4
+
 def test_em_selection():
     """
     test that the basic GMM-based model selection tool
@@ -140,6 +175,15 @@ def test_em_selection():
     lgmm = gmm.best_fitting_GMM(x,krange,prec_type='full',
                                 niter=100,delta = 1.e-4,ninit=1,verbose=0)
     assert (lgmm.k<4)
+
+def test_em_selection_parallel():
+    """
+    test that the model selection can be distributed over processes
+    """
+    dim = 2
+    x = np.concatenate((nr.randn(100,dim),3+2*nr.randn(100,dim)))
+    lgmm = gmm.best_fitting_GMM(x, range(1,5), prec_type='full', n_jobs=2)
+    assert (lgmm.k<4)
     
 
 def test_em_gmm_full(verbose=0):
@@ -193,6 +237,60 @@ def test_em_gmm_diag(verbose=0):
 
     assert((z.max()+1==lgmm.k)&(bic[4]<bic[1]))
 
+def test_em_gmm_spherical(verbose=0):
+    """
+    Computing the BIC value for GMMs with different number of classes,
+    with isotropic covariance models
+    The BIC should maximal for a number of classes of 1  or 2
+    """
+    # generate some data
+    dim = 2
+    x = np.concatenate((nr.randn(1000,dim),3+2*nr.randn(1000,dim)))
+    
+    # estimate different GMMs of that data
+    maxiter = 100
+    delta = 1.e-8
+    prec_type='spherical'
+
+    bic = np.zeros(5)
+    for k in range(1,6):
+        lgmm = GMM(k,dim,prec_type)
+        lgmm.initialize(x)
+        bic[k-1] = lgmm.estimate(x,maxiter,delta,verbose)
+        if verbose: print "bic of the %d-classes model"%k, bic
+
+    assert lgmm.precisions.shape == (5,)
+    assert(bic[4]<bic[1])
+
+def test_em_loglike_spherical():
+    """
+    check the average log-likelihood of an isotropic model
+    """
+    dim = 3
+    k = 1
+    n = 1000
+    scale = 3.
+    offset = 4.
+    x = offset + scale * nr.randn(n,dim)
+    lgmm = GMM(k,dim,'spherical')
+    lgmm.initialize(x)
+    lgmm.estimate(x)
+    ll = lgmm.average_log_like(x)
+    ent = dim*0.5*(1+np.log(2*np.pi*scale**2))
+    assert np.absolute(ll+ent)<dim*3./np.sqrt(n)
+
+def test_unweighted_likelihood_legacy():
+    """
+    check the vectorized likelihood against the loop-based one
+    for all the precision types
+    """
+    x = nr.randn(50, 3)
+    for prec_type in ['full', 'diag', 'spherical']:
+        lgmm = GMM(2, 3, prec_type)
+        lgmm.initialize(x)
+        assert np.allclose(lgmm.unweighted_likelihood(x),
+                           lgmm.unweighted_likelihood_(x))
+
 def test_em_gmm_multi(verbose=0):
     """
     Playing with various initilizations on the same data
@@ -221,6 +319,43 @@ def test_em_gmm_multi(verbose=0):
 
     assert (np.isfinite(bic))
     
+def test_em_gmm_init_methods():
+    """
+    test the different initialization methods on well separated clusters
+    """
+    dim = 2
+    x = np.concatenate((nr.randn(100,dim),10+nr.randn(100,dim)))
+    u = np.zeros(200)
+    u[100:] = 1
+    lgmm = GMM(2,dim)
+    lgmm.initialize(x, 'kmeans++')
+    lgmm.estimate(x)
+    z = lgmm.map_label(x)
+    assert np.absolute(np.corrcoef(z, u)[0, 1])>0.9
+
+    # random labels are a poor start, just check that it runs
+    lgmm = GMM(2,dim)
+    lgmm.initialize(x, 'random')
+    assert np.isfinite(lgmm.estimate(x))
+
+    # the method is forwarded by train
+    lgmm = GMM(2,dim).train(x, init_method='kmeans++')
+    assert lgmm.k==2
+
+def test_kmeanspp():
+    """
+    test that the k-means++ seeding separates distinct clusters
+    """
+    nr.seed(0) # force the random sequence
+    x = np.concatenate((nr.randn(50,2),20+nr.randn(50,2),
+                        -20+nr.randn(50,2)))
+    z = gmm._kmeanspp(x, 3)
+    nr.seed(None) # re-randomize the seed
+    assert z.shape == (150,)
+    for i in range(3):
+        assert np.unique(z[50*i:50*(i+1)]).size==1
+    assert np.unique(z).size==3
+
 def test_em_gmm_largedim(verbose=0):
     """
     testing the GMM model in larger dimensions
@@ -381,6 +516,69 @@ def _test_select_gmm_old_diag(verbose=0):
         
     assert(lgmm.k<5)
 
+def test_make_grid():
+    """
+    test that the grid points are enumerated with the last coordinate
+    varying fastest, in any dimension
+    """
+    gd = gmm.GridDescriptor(3, [0, 1, 0, 2, 0, 3], [2, 3, 4])
+    grid = gd.make_grid()
+    assert grid.shape == (24, 3)
+    assert np.allclose(grid[1], [0, 0, 1])
+    assert np.allclose(grid[4], [0, 1, 0])
+    assert np.allclose(grid[-1], [1, 2, 3])
+    gd = gmm.GridDescriptor(4, [0, 1]*4, [2]*4)
+    assert gd.make_grid().shape == (16, 4)
+
+def test_likelihood_inplace_precisions():
+    """
+    test that the likelihood follows in-place changes of the precisions
+    and that singular precisions yield a zero likelihood
+    """
+    x = nr.randn(50, 2)
+    lgmm = gmm.GMM(2, 2)
+    lgmm.plugin(np.zeros((2, 2)), np.array([np.eye(2), np.eye(2)]),
+                np.ones(2)/2)
+    like = lgmm.unweighted_likelihood(x)
+    lgmm.precisions[0] *= 4
+    like4 = lgmm.unweighted_likelihood(x)
+    assert np.allclose(like4[:, 1], like[:, 1])
+    assert not np.allclose(like4[:, 0], like[:, 0])
+    lgmm.precisions[0] = np.array([[1., 0], [0, 0]])
+    like0 = lgmm.unweighted_likelihood(x)
+    assert np.all(like0[:, 0] == 0)
+    assert np.allclose(like0[:, 1], like[:, 1])
+
+def test_bic_log_like_sum():
+    """
+    test that the bic computed from the total log-likelihood
+    equals the one computed from the component-wise likelihood
+    """
+    x = nr.randn(100, 2)
+    lgmm = gmm.GMM(2, 2)
+    lgmm.initialize(x)
+    like = lgmm.likelihood(x)
+    lls = np.sum(np.log(np.sum(like, 1) + 1.e-15))
+    assert np.allclose(lgmm.bic(like), lgmm.bic(log_like_sum=lls, n=100))
+    assert_raises(ValueError, lgmm.bic)
+    assert_raises(ValueError, lgmm.bic, log_like_sum=lls)
+
+def test_em_relative_convergence():
+    """
+    test that EM stops before niter on a well-separated mixture,
+    and that the number of iterations is recorded
+    """
+    x = np.concatenate((nr.randn(100, 2), 10 + nr.randn(100, 2)))
+    lgmm = gmm.GMM(2, 2)
+    lgmm.initialize(x)
+    lgmm.estimate(x, niter=100, delta=1.e-4)
+    assert 0 < lgmm.niter_done < 100
+    # the average log-likelihood is then close to 0
+    x *= 0.17
+    lgmm.initialize(x)
+    lgmm.estimate(x, niter=100, delta=1.e-4)
+    assert 0 < lgmm.niter_done < 100
+
 
 if __name__ == '__main__':
     import nose